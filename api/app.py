@@ -1,7 +1,26 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file
+from flask import Flask, Response, render_template, request, redirect, url_for, flash
+import numpy as np
 import pandas as pd
+import hashlib
 import io
 import logging
+import os
+import re
+import stat
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from xml.sax.saxutils import escape
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+try:
+    import xlsxwriter
+except ImportError:  # fall back to openpyxl's write-only mode
+    xlsxwriter = None
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key_here'  # change in production
@@ -10,123 +29,551 @@ app.secret_key = 'your_secret_key_here'  # change in production
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
-ALLOWED_EXTENSIONS = {'xls', 'xlsx'}
+ALLOWED_EXTENSIONS = ('.xls', '.xlsx')
+
+CENTRAL_REQUIRED = ['Valid From', 'Supplier Name', 'Status', 'Assigned']
+PMD_REQUIRED = ['Valid From', 'Supplier Name']
+
+OUTPUT_COLUMNS = [
+    'Valid From', 'Bukr.', 'Type', 'EBSNO', 'Supplier Name', 'Street',
+    'City', 'Country', 'Zip Code', 'Requested By', 'Pur. approver',
+    'Pur. release date', 'Status', 'Assigned'
+]
+
+# Only parse the columns we match on or return; Status/Assigned are computed
+CENTRAL_COLUMNS = frozenset(CENTRAL_REQUIRED)
+PMD_COLUMNS = frozenset(PMD_REQUIRED + OUTPUT_COLUMNS) - {'Status', 'Assigned'}
+
+# Status is only compared, so it is parsed straight into the nullable string dtype.
+# Supplier Name is also written out and keeps its parsed type (numbers stay numbers);
+# prepare_frame builds a string copy of it for the match keys.
+READ_DTYPES = {'Status': 'string'}
+
+# All the lookup needs from a cleaned central frame
+CENTRAL_LOOKUP_COLUMNS = ['Valid From_day', 'Supplier Name_key', 'Status', 'Assigned']
+
+# Cleaned central frames, keyed by a hash of the uploaded bytes. Entries are
+# unpickled, so the directory must be private to this user.
+CACHE_DIR = os.path.join(tempfile.gettempdir(), 'pmd_lookup_cache')
+# Bump when the cleaned central frame changes shape or meaning
+CACHE_VERSION = 4
+# Least recently used entries are deleted once the directory grows past this
+CACHE_MAX_BYTES = 128 * 1024 * 1024
+
+# Cleaned PMD frames kept in each worker's memory, least recently used first,
+# bounded by their in-memory size; larger frames are never cached
+PMD_CACHE_MAX_BYTES = 256 * 1024 * 1024
+_pmd_cache = OrderedDict()  # digest -> (frame, nbytes)
+_pmd_cache_bytes = 0
+_pmd_cache_lock = threading.Lock()
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+RESULT_FILENAME = 'PMD_Lookup_Result.xlsx'
+CSV_MIMETYPE = 'text/csv'
+CSV_RESULT_FILENAME = 'PMD_Lookup_Result.csv'
+# CSV has no cell formats, so dates are written as the workbook displays them:
+# Valid From as VALID_FROM_NUM_FORMAT, other datetimes as DATETIME_NUM_FORMAT
+CSV_VALID_FROM_FORMAT = '%Y-%m-%d %I:%M %p'
+CSV_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Results stay in memory up to this size, then spill to a temp file
+SPOOL_MAX_SIZE = 16 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+# Output styles, defined once and applied per row or column rather than per cell
+DATETIME_NUM_FORMAT = 'yyyy-mm-dd hh:mm:ss'
+VALID_FROM_NUM_FORMAT = 'yyyy-mm-dd hh:mm AM/PM'
+HEADER_FORMAT = {'bold': True}
+VALID_FROM_FORMAT = {'num_format': VALID_FROM_NUM_FORMAT}
+HEADER_FONT = Font(bold=True)
+
+# Above this many rows, skip the writer libraries and emit sheet XML directly
+DIRECT_XLSX_MIN_ROWS = 50_000
+EXCEL_EPOCH = datetime(1899, 12, 30)
+
+_SHEET_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+_DOC_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_XML_DECL = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+# Control characters XML 1.0 cannot carry; Excel reads them back from _xHHHH_
+_XML_ILLEGAL_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+# Static parts of a one-sheet workbook; only sheet1.xml varies per request.
+# Cell styles: 1 = header, 2 = datetime, 3 = Valid From
+XLSX_TEMPLATE = {
+    '[Content_Types].xml': (
+        _XML_DECL +
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        _XML_DECL +
+        f'<Relationships xmlns="{_REL_NS}">'
+        f'<Relationship Id="rId1" Type="{_DOC_REL}/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        _XML_DECL +
+        f'<workbook xmlns="{_SHEET_NS}" xmlns:r="{_DOC_REL}">'
+        '<sheets><sheet name="Result" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        _XML_DECL +
+        f'<Relationships xmlns="{_REL_NS}">'
+        f'<Relationship Id="rId1" Type="{_DOC_REL}/worksheet" Target="worksheets/sheet1.xml"/>'
+        f'<Relationship Id="rId2" Type="{_DOC_REL}/styles" Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/styles.xml': (
+        _XML_DECL +
+        f'<styleSheet xmlns="{_SHEET_NS}">'
+        f'<numFmts count="2"><numFmt numFmtId="164" formatCode="{DATETIME_NUM_FORMAT}"/>'
+        f'<numFmt numFmtId="165" formatCode="{VALID_FROM_NUM_FORMAT}"/></numFmts>'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="4"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+        '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="165" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '</cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'
+    ),
+}
 
 
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return filename.lower().endswith(ALLOWED_EXTENSIONS)
 
 
-@app.route('/', methods=['GET'])
-def index():
-    return render_template('index.html')
+def read_excel_upload(file_storage, columns):
+    """Read the given columns of an uploaded workbook, preferring calamine."""
+    # Werkzeug spools uploads to a seekable file; read it in place
+    stream = file_storage.stream
+    stream.seek(0)
+    # A callable leaves missing columns to the required-column check
+    usecols = columns.__contains__
+    try:
+        return pd.read_excel(stream, engine='calamine', usecols=usecols, dtype=READ_DTYPES)
+    except Exception as e:
+        logging.warning("calamine could not read %s (%s); using default engine",
+                        file_storage.filename, e)
+        stream.seek(0)
+        return pd.read_excel(stream, usecols=usecols, dtype=READ_DTYPES)
 
 
-@app.route('/process', methods=['POST'])
-def process_files():
+def to_datetime_column(series):
+    """Coerce a date column to datetime64, skipping the work when it already is."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
     try:
-        # -------------------- FILE VALIDATION --------------------
-        if 'central_file' not in request.files or 'pmd_lookup_file' not in request.files:
-            flash('Both files are required.', 'error')
-            return redirect(url_for('index'))
+        return pd.to_datetime(series, format='ISO8601')
+    except (ValueError, TypeError):
+        # Not uniformly ISO 8601: let pandas infer, blanking what it cannot parse
+        return pd.to_datetime(series, errors='coerce')
 
-        central_file = request.files['central_file']
-        pmd_file = request.files['pmd_lookup_file']
 
-        if central_file.filename == '' or pmd_file.filename == '':
-            flash('Please select both files.', 'error')
-            return redirect(url_for('index'))
+def require_columns(columns, required, label):
+    for col in required:
+        if col not in columns:
+            raise KeyError(f"{label} file missing column: {col}")
 
-        if not (allowed_file(central_file.filename) and allowed_file(pmd_file.filename)):
-            flash('Only Excel files (.xls, .xlsx) are allowed.', 'error')
-            return redirect(url_for('index'))
 
-        # -------------------- READ FILES --------------------
-        central_df = pd.read_excel(io.BytesIO(central_file.read()))
-        pmd_df = pd.read_excel(io.BytesIO(pmd_file.read()))
+def prepare_frame(df, required, label):
+    """Check required columns, parse dates, build match keys and drop unusable rows."""
+    require_columns(df.columns, required, label)
 
-        # -------------------- REQUIRED COLUMNS --------------------
-        central_required = ['Valid From', 'Supplier Name', 'Status', 'Assigned']
-        pmd_required = ['Valid From', 'Supplier Name']
+    # Parsed in place: the output reuses this column, so no second copy is carried
+    df['Valid From'] = to_datetime_column(df['Valid From'])
+    valid_from = df['Valid From']
+    if valid_from.dt.tz is not None:
+        # Match on the wall-clock date as written, not the date in UTC
+        valid_from = valid_from.dt.tz_localize(None)
+    df['Valid From_day'] = valid_from.dt.floor('D')
+    df['Supplier Name_key'] = df['Supplier Name'].astype('string').str.strip()
 
-        for col in central_required:
-            if col not in central_df.columns:
-                raise KeyError(f"Central file missing column: {col}")
+    return df.loc[df['Valid From'].notna() & df['Supplier Name_key'].notna()]
 
-        for col in pmd_required:
-            if col not in pmd_df.columns:
-                raise KeyError(f"PMD file missing column: {col}")
 
-        # -------------------- DATE NORMALIZATION --------------------
-        central_df['Valid From_dt'] = pd.to_datetime(central_df['Valid From'], errors='coerce')
-        pmd_df['Valid From_dt'] = pd.to_datetime(pmd_df['Valid From'], errors='coerce')
+def file_digest(file_storage):
+    """Hash an upload in chunks, leaving its stream rewound."""
+    stream = file_storage.stream
+    stream.seek(0)
+    digest = hashlib.blake2b(digest_size=16)
+    for chunk in iter(lambda: stream.read(1 << 20), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
 
-        central_df.dropna(subset=['Valid From_dt', 'Supplier Name'], inplace=True)
-        pmd_df.dropna(subset=['Valid From_dt', 'Supplier Name'], inplace=True)
 
-        # -------------------- CREATE MATCH KEY --------------------
-        central_df['comp_key'] = (
-            central_df['Valid From_dt'].dt.strftime('%Y-%m-%d') + '__' +
-            central_df['Supplier Name'].astype(str).str.strip()
-        )
+def private_cache_dir():
+    """Return CACHE_DIR, creating it, if only this user can access it; otherwise None."""
+    try:
+        os.makedirs(CACHE_DIR, mode=0o700, exist_ok=True)
+        st = os.lstat(CACHE_DIR)
+        if os.name != 'posix':
+            return CACHE_DIR if stat.S_ISDIR(st.st_mode) else None
+
+        # Someone else may have created the path, or been able to write into it;
+        # never load pickles from it then
+        if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o022:
+            logging.warning("Not caching: %s is not a private directory", CACHE_DIR)
+            return None
+        if st.st_mode & 0o077:
+            os.chmod(CACHE_DIR, 0o700)  # e.g. created by an older release
+    except OSError as e:
+        logging.warning("Could not set up cache directory %s: %s", CACHE_DIR, e)
+        return None
+    return CACHE_DIR
+
+
+def read_cached_frame(path):
+    """Return the frame pickled at path, or None, deleting entries that cannot be loaded."""
+    try:
+        df = pd.read_pickle(path)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        # Truncated or corrupt, or written by an incompatible pandas/numpy
+        logging.warning("Discarding unreadable cache entry %s: %s", path, e)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
 
-        pmd_df['comp_key'] = (
-            pmd_df['Valid From_dt'].dt.strftime('%Y-%m-%d') + '__' +
-            pmd_df['Supplier Name'].astype(str).str.strip()
-        )
+    try:
+        os.utime(path)  # mark as recently used for prune_cache
+    except OSError:
+        pass
+    return df
+
+
+def prune_cache(cache_dir):
+    """Delete the least recently used cache entries until they fit in CACHE_MAX_BYTES."""
+    entries = []
+    with os.scandir(cache_dir) as it:
+        for entry in it:
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+
+def load_central(file_storage):
+    """Return the cleaned central frame, reusing the on-disk copy for repeat uploads."""
+    cache_dir = private_cache_dir()
+    if cache_dir is not None:
+        path = os.path.join(cache_dir, f'{file_digest(file_storage)}.v{CACHE_VERSION}.pkl')
+        central_df = read_cached_frame(path)
+        if central_df is not None:
+            return central_df
+
+    central_df = prepare_frame(read_excel_upload(file_storage, CENTRAL_COLUMNS),
+                               CENTRAL_REQUIRED, 'Central')[CENTRAL_LOOKUP_COLUMNS]
+    # Normalize once so approval is a category-code comparison on every use
+    central_df['Status'] = central_df['Status'].str.strip().str.casefold().astype('category')
+    if cache_dir is None:
+        return central_df
 
-        # -------------------- CENTRAL LOOKUP (NO JOIN) --------------------
-        central_lookup = central_df.set_index('comp_key')[['Status', 'Assigned']]
+    try:
+        # Write then rename so concurrent requests never see a partial file
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        central_df.to_pickle(tmp_path)
+        os.replace(tmp_path, path)
+        prune_cache(cache_dir)
+    except OSError as e:
+        logging.warning("Could not cache central file: %s", e)
+    return central_df
+
+
+def load_pmd(file_storage):
+    """Return the cleaned PMD frame, reusing a recent in-memory copy for repeat uploads.
+
+    Cached frames are shared between requests and must not be modified.
+    """
+    global _pmd_cache_bytes
+
+    digest = file_digest(file_storage)
+    with _pmd_cache_lock:
+        if digest in _pmd_cache:
+            _pmd_cache.move_to_end(digest)
+            return _pmd_cache[digest][0]
+
+    pmd_df = prepare_frame(read_excel_upload(file_storage, PMD_COLUMNS), PMD_REQUIRED, 'PMD')
+
+    nbytes = int(pmd_df.memory_usage(deep=True).sum())
+    if nbytes > PMD_CACHE_MAX_BYTES:
+        return pmd_df
+
+    with _pmd_cache_lock:
+        if digest not in _pmd_cache:
+            _pmd_cache[digest] = (pmd_df, nbytes)
+            _pmd_cache_bytes += nbytes
+        while _pmd_cache_bytes > PMD_CACHE_MAX_BYTES:
+            _pmd_cache_bytes -= _pmd_cache.popitem(last=False)[1][1]
+    return pmd_df
+
+
+def packed_match_keys(days, supplier_codes):
+    """Pack each row's (day, supplier code) match key into one int64."""
+    days = days.to_numpy(dtype='datetime64[D]').astype(np.int64)
+    return (days << 32) | supplier_codes.astype(np.int64)
+
+
+def decide_status(pos, central_approved, central_assigned):
+    """Return (status, assigned) arrays for PMD rows from their central positions (-1 = none)."""
+    # No match → New, Match + Approved → Ignore, Match + Not Approved → Hold
+    matched = pos >= 0
+    approved = np.append(central_approved, False)[pos]
+    hold = matched & ~approved
+
+    status = np.select([~matched, hold], ['New', 'Hold'], default=None)
+    assigned = np.where(hold, np.append(central_assigned, None)[pos], None)
+    return status, assigned
+
+
+def write_result_xlsx(df, output):
+    """Write df to output as the 'Result' sheet, streaming one row at a time."""
+    if len(df) > DIRECT_XLSX_MIN_ROWS:
+        write_result_xlsx_direct(df, output)
+        return
+
+    values = df.astype(object).where(df.notna(), None)
+    rows = values.itertuples(index=False, name=None)
+
+    if xlsxwriter is None:
+        workbook = openpyxl.Workbook(write_only=True)
+        worksheet = workbook.create_sheet('Result')
+        header = []
+        for col in df.columns:
+            cell = WriteOnlyCell(worksheet, value=col)
+            cell.font = HEADER_FONT
+            header.append(cell)
+        worksheet.append(header)
+
+        date_col = df.columns.get_loc('Valid From') if 'Valid From' in df.columns else None
+        for row in rows:
+            if date_col is not None and row[date_col] is not None:
+                cell = WriteOnlyCell(worksheet, value=row[date_col])
+                cell.number_format = VALID_FROM_NUM_FORMAT
+                row = row[:date_col] + (cell,) + row[date_col + 1:]
+            worksheet.append(row)
+        workbook.save(output)
+        return
+
+    workbook = xlsxwriter.Workbook(output, {
+        'constant_memory': True,
+        'strings_to_urls': False,
+        'default_date_format': DATETIME_NUM_FORMAT,
+    })
+    worksheet = workbook.add_worksheet('Result')
+    worksheet.set_row(0, None, workbook.add_format(HEADER_FORMAT))
+    worksheet.write_row(0, 0, df.columns)
+
+    # One shared format object for the column; None keeps the type's default
+    valid_from_format = workbook.add_format(VALID_FROM_FORMAT)
+    column_formats = [valid_from_format if col == 'Valid From' else None for col in df.columns]
+    for row_idx, row in enumerate(rows, start=1):
+        for col_idx, (value, cell_format) in enumerate(zip(row, column_formats)):
+            worksheet.write(row_idx, col_idx, value, cell_format)
+
+    workbook.close()
+
+
+def xml_text(value):
+    """Escape a value for sheet XML, writing control characters as XlsxWriter does."""
+    text = _XML_ILLEGAL_CHARS.sub(lambda m: f'_x{ord(m.group()):04X}_', str(value))
+    return escape(text)
+
+
+def xml_cell(value, date_style):
+    """Render one value as a sheet cell: numbers, bools and dates as values, the rest as inline strings."""
+    if value is None:
+        return '<c/>'
+    if isinstance(value, datetime):
+        # Excel stores datetimes as days since 1899-12-30
+        serial = (value - EXCEL_EPOCH) / timedelta(days=1)
+        return f'<c s="{date_style}"><v>{serial!r}</v></c>'
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c><v>{value!r}</v></c>'
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{xml_text(value)}</t></is></c>'
+
+
+def write_result_xlsx_direct(df, output):
+    """Write df as a minimal workbook by streaming sheet XML into the zip."""
+    values = df.astype(object).where(df.notna(), None)
+
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        for name, xml in XLSX_TEMPLATE.items():
+            zf.writestr(name, xml)
+
+        with io.TextIOWrapper(zf.open('xl/worksheets/sheet1.xml', 'w'), encoding='utf-8') as sheet:
+            sheet.write(f'{_XML_DECL}<worksheet xmlns="{_SHEET_NS}"><sheetData>')
+            # Style 1 in the template is the bold header
+            sheet.write('<row>' + ''.join(
+                f'<c t="inlineStr" s="1"><is><t xml:space="preserve">{xml_text(col)}</t></is></c>'
+                for col in df.columns
+            ) + '</row>')
+            date_styles = ['3' if col == 'Valid From' else '2' for col in df.columns]
+            for row in values.itertuples(index=False, name=None):
+                sheet.write('<row>' + ''.join(map(xml_cell, row, date_styles)) + '</row>')
+            sheet.write('</sheetData></worksheet>')
+
+
+def write_result_csv(df, output):
+    """Write df to output as CSV, formatting datetime columns like the workbook."""
+    formatted = {
+        col: df[col].dt.strftime(
+            CSV_VALID_FROM_FORMAT if col == 'Valid From' else CSV_DATETIME_FORMAT)
+        for col in df.columns if pd.api.types.is_datetime64_any_dtype(df[col])
+    }
+    df.assign(**formatted).to_csv(output, mode='wb', index=False)
+
+
+def iter_file(fileobj):
+    """Yield fileobj from the start in CHUNK_SIZE pieces, closing it when done."""
+    try:
+        fileobj.seek(0)
+        yield from iter(lambda: fileobj.read(CHUNK_SIZE), b'')
+    finally:
+        fileobj.close()
 
-        # -------------------- BUSINESS LOGIC --------------------
-        def determine_status(row):
-            # No match → New
-            if row['comp_key'] not in central_lookup.index:
-                return 'New', None
 
-            central_status = central_lookup.loc[row['comp_key'], 'Status']
-            central_assigned = central_lookup.loc[row['comp_key'], 'Assigned']
+def wants_csv():
+    """True when the client asked for CSV via ?format=csv or its Accept header."""
+    if request.args.get('format') == 'csv':
+        return True
+    # XLSX is listed first so wildcard Accept headers (browsers) keep getting it
+    return request.accept_mimetypes.best_match([XLSX_MIMETYPE, CSV_MIMETYPE]) == CSV_MIMETYPE
 
-            # Match + Approved → Ignore
-            if isinstance(central_status, str) and central_status.lower() == 'approved':
-                return None, None
 
-            # Match + Not Approved → Hold
-            return 'Hold', central_assigned
+def validate_uploads(files):
+    """Return (central_file, pmd_file, error_message) for a request's uploads."""
+    if 'central_file' not in files or 'pmd_lookup_file' not in files:
+        return None, None, 'Both files are required.'
 
-        pmd_df[['Status', 'Assigned']] = pmd_df.apply(
-            lambda r: determine_status(r),
-            axis=1,
-            result_type='expand'
-        )
+    central_file = files['central_file']
+    pmd_file = files['pmd_lookup_file']
+
+    if central_file.filename == '' or pmd_file.filename == '':
+        return None, None, 'Please select both files.'
 
-        # Remove ignored rows
-        final_df = pmd_df[pmd_df['Status'].notna()].copy()
+    if not (allowed_file(central_file.filename) and allowed_file(pmd_file.filename)):
+        return None, None, 'Only Excel files (.xls, .xlsx) are allowed.'
 
-        # -------------------- FORMAT & OUTPUT --------------------
-        final_df['Valid From'] = final_df['Valid From_dt'].dt.strftime('%Y-%m-%d %I:%M %p')
+    return central_file, pmd_file, None
 
-        output_columns = [
-            'Valid From', 'Bukr.', 'Type', 'EBSNO', 'Supplier Name', 'Street',
-            'City', 'Country', 'Zip Code', 'Requested By', 'Pur. approver',
-            'Pur. release date', 'Status', 'Assigned'
-        ]
 
-        final_df = final_df[[col for col in output_columns if col in final_df.columns]]
+def build_result(central_file, pmd_file):
+    """Match the PMD upload against the central upload and return the output frame."""
+    # -------------------- READ FILES --------------------
+    # The PMD file goes first so a bad one is rejected before the central parse
+    pmd_df = load_pmd(pmd_file)
+    central_df = load_central(central_file)
+
+    # -------------------- MATCH KEYS --------------------
+    # Factorize both sides together so supplier names share one integer codebook;
+    # the frames themselves are left untouched (pmd_df may be a cached copy)
+    supplier_codes, _ = pd.factorize(
+        pd.concat([central_df['Supplier Name_key'], pmd_df['Supplier Name_key']],
+                  ignore_index=True)
+    )
+    central_keys = packed_match_keys(central_df['Valid From_day'],
+                                     supplier_codes[:len(central_df)])
+    pmd_keys = packed_match_keys(pmd_df['Valid From_day'], supplier_codes[len(central_df):])
+
+    # -------------------- CENTRAL LOOKUP --------------------
+    # Status was casefolded into a category on load, so this compares codes
+    approved = central_df['Status'].eq('approved').to_numpy(dtype=bool)
+
+    # Keep one central row per key, preferring a non-approved one so a duplicated
+    # key still goes to Hold; the stable sort keeps file order within each group
+    order = np.argsort(approved, kind='stable')
+    first = ~pd.Index(central_keys[order]).duplicated()
+    lookup_rows = order[first]
+    pos = pd.Index(central_keys[lookup_rows]).get_indexer(pmd_keys)
+
+    central_approved = approved[lookup_rows]
+    central_assigned = central_df['Assigned'].to_numpy(dtype=object)[lookup_rows]
+
+    # -------------------- BUSINESS LOGIC --------------------
+    status, assigned = decide_status(pos, central_approved, central_assigned)
+
+    # -------------------- FORMAT & OUTPUT --------------------
+    # Gather the kept rows once; ignored rows (no status) never get result columns
+    keep = pd.notna(status)
+    # Valid From stays a datetime; the writers apply VALID_FROM_NUM_FORMAT to it
+    final_df = pmd_df.loc[keep].reindex(columns=OUTPUT_COLUMNS)
+    final_df['Status'] = status[keep]
+    final_df['Assigned'] = assigned[keep]
+
+    # Excel has no timezones: write tz-aware dates as their wall-clock time,
+    # the same day the match keys were built from
+    for col in final_df.columns:
+        if isinstance(final_df[col].dtype, pd.DatetimeTZDtype):
+            final_df[col] = final_df[col].dt.tz_localize(None)
+
+    return final_df
+
+
+@app.route('/', methods=['GET'])
+def index():
+    return render_template('index.html')
+
+
+@app.route('/process', methods=['POST'])
+def process_files():
+    try:
+        # -------------------- FILE VALIDATION --------------------
+        central_file, pmd_file, error = validate_uploads(request.files)
+        if error:
+            flash(error, 'error')
+            return redirect(url_for('index'))
 
-        # -------------------- CREATE EXCEL --------------------
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            final_df.to_excel(writer, index=False, sheet_name='Result')
+        final_df = build_result(central_file, pmd_file)
 
-        output.seek(0)
+        # -------------------- CREATE OUTPUT --------------------
+        output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        if wants_csv():
+            write_result_csv(final_df, output)
+            mimetype, filename = CSV_MIMETYPE, CSV_RESULT_FILENAME
+        else:
+            write_result_xlsx(final_df, output)
+            mimetype, filename = XLSX_MIMETYPE, RESULT_FILENAME
 
         flash('File processed successfully!', 'success')
-        return send_file(
-            output,
-            as_attachment=True,
-            download_name='PMD_Lookup_Result.xlsx',
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        return Response(
+            iter_file(output),
+            mimetype=mimetype,
+            headers={
+                'Content-Disposition': f'attachment; filename={filename}',
+                # Let reverse proxies pass chunks through instead of buffering them
+                'X-Accel-Buffering': 'no',
+            }
         )
 
     except Exception as e:
@@ -136,4 +583,5 @@ def process_files():
 
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    # Development server only; production runs under gunicorn via wsgi.py
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1')
@@ -0,0 +1,147 @@
+import io
+import os
+import sys
+from datetime import datetime
+
+import openpyxl
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+import app as pmd_app  # noqa: E402
+
+CENTRAL_HEADER = ['Valid From', 'Supplier Name', 'Status', 'Assigned']
+PMD_HEADER = ['Valid From', 'Supplier Name', 'City']
+
+
+@pytest.fixture(autouse=True)
+def isolated_caches(monkeypatch, tmp_path):
+    monkeypatch.setattr(pmd_app, 'CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(pmd_app, '_pmd_cache', pmd_app.OrderedDict())
+    monkeypatch.setattr(pmd_app, '_pmd_cache_bytes', 0)
+
+
+def workbook(header, rows):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(header)
+    for row in rows:
+        ws.append(row)
+    buf = io.BytesIO()
+    wb.save(buf)
+    buf.seek(0)
+    return buf
+
+
+def process(central_rows, pmd_rows, query='', client=None, pmd_header=PMD_HEADER):
+    client = client or pmd_app.app.test_client()
+    return client.post('/process' + query, content_type='multipart/form-data', data={
+        'central_file': (workbook(CENTRAL_HEADER, central_rows), 'central.xlsx'),
+        'pmd_lookup_file': (workbook(pmd_header, pmd_rows), 'pmd.xlsx'),
+    })
+
+
+def result_rows(response):
+    assert response.status_code == 200, response.headers.get('Location')
+    return pd.read_excel(io.BytesIO(response.data), engine='openpyxl')
+
+
+@pytest.mark.parametrize('writer', ['xlsxwriter', 'openpyxl', 'direct'])
+def test_tz_aware_valid_from_is_written_as_wall_clock_time(monkeypatch, writer):
+    if writer == 'openpyxl':
+        monkeypatch.setattr(pmd_app, 'xlsxwriter', None)
+    elif writer == 'direct':
+        monkeypatch.setattr(pmd_app, 'DIRECT_XLSX_MIN_ROWS', 0)
+    response = process(
+        [['2024-01-01T09:00:00+02:00', 'Acme', 'Pending', 'Ann']],
+        [['2024-01-01T09:00:00+02:00', 'Acme', 'Oslo'],
+         ['2024-01-02T09:00:00+02:00', 'Acme', 'Oslo']],
+    )
+
+    result = result_rows(response)
+    assert result['Status'].tolist() == ['Hold', 'New']
+    assert result['Valid From'].tolist() == [pd.Timestamp('2024-01-01 09:00'),
+                                             pd.Timestamp('2024-01-02 09:00')]
+
+
+def test_tz_aware_central_matches_on_wall_clock_date():
+    # 00:00 at +02:00 is still 2023-12-31 in UTC
+    response = process(
+        [['2024-01-01T00:00:00+02:00', 'Acme', 'Pending', 'Ann']],
+        [['2024-01-01 09:00', 'Acme', 'Oslo']],
+    )
+
+    result = result_rows(response)
+    assert result['Status'].tolist() == ['Hold']
+    assert result['Assigned'].tolist() == ['Ann']
+
+
+def test_status_rule():
+    response = process(
+        [
+            ['2024-01-01', 'Approved Co', 'Approved', 'Ann'],
+            ['2024-01-01', 'Padded Co', ' Approved ', 'Ann'],
+            # Duplicated key, all approved: still ignored
+            ['2024-01-01', 'Twice Co', 'Approved', 'Ann'],
+            ['2024-01-01', 'Twice Co', 'APPROVED', 'Bob'],
+            # Duplicated key with a non-approved row: that row wins
+            ['2024-01-01', 'Mixed Co', 'Approved', 'Ann'],
+            ['2024-01-01', 'Mixed Co', 'Pending', 'Bob'],
+            ['2024-01-01', 'Held Co', None, 'Cid'],
+        ],
+        [
+            ['2024-01-01', 'Approved Co', 'Oslo'],
+            ['2024-01-01', 'Padded Co', 'Oslo'],
+            ['2024-01-01', 'Twice Co', 'Oslo'],
+            ['2024-01-01', 'Mixed Co', 'Oslo'],
+            ['2024-01-01', 'Held Co', 'Oslo'],
+            ['2024-01-02', 'Held Co', 'Oslo'],
+        ],
+    )
+
+    result = result_rows(response)
+    assert result[['Supplier Name', 'Status', 'Assigned']].fillna('').values.tolist() == [
+        ['Mixed Co', 'Hold', 'Bob'],
+        ['Held Co', 'Hold', 'Cid'],
+        ['Held Co', 'New', ''],
+    ]
+
+
+def test_supplier_name_is_written_as_uploaded():
+    # Matching strips and stringifies names; the output keeps the original cell
+    response = process(
+        [['2024-01-01', 123, 'Pending', 'Ann'],
+         ['2024-01-01', 'Acme', 'Pending', 'Ann']],
+        [['2024-01-01', 123, 'Oslo'],
+         ['2024-01-01', ' Acme ', 'Oslo']],
+    )
+
+    result = result_rows(response)
+    assert result['Supplier Name'].tolist() == [123, ' Acme ']
+    assert result['Status'].tolist() == ['Hold', 'Hold']
+
+
+def test_missing_column_is_reported():
+    client = pmd_app.app.test_client()
+    response = process([['2024-01-01', 'Acme', 'Pending', 'Ann']], [['2024-01-01', 'Oslo']],
+                       client=client, pmd_header=['Valid From', 'City'])
+
+    assert response.status_code == 302
+    with client.session_transaction() as session:
+        messages = [message for _, message in session['_flashes']]
+    assert messages == ["Error: 'PMD file missing column: Supplier Name'"]
+
+
+def test_csv_formats_dates_like_the_workbook():
+    response = process(
+        [['2024-01-01', 'Acme', 'Pending', 'Ann']],
+        [['2024-01-01 09:00', 'Acme', datetime(2024, 1, 3)]],
+        query='?format=csv', pmd_header=['Valid From', 'Supplier Name', 'Pur. release date'],
+    )
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    result = pd.read_csv(io.BytesIO(response.data), dtype=str)
+    assert result.loc[0, 'Valid From'] == '2024-01-01 09:00 AM'
+    assert result.loc[0, 'Pur. release date'] == '2024-01-03 00:00:00'
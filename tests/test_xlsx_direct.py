@@ -0,0 +1,42 @@
+import io
+import os
+import sys
+import zipfile
+from xml.etree import ElementTree
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+from app import write_result_xlsx_direct, xml_cell  # noqa: E402
+
+SHEET_NS = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+
+
+def test_xml_cell_encodes_control_characters():
+    assert 'bad_x000B_char' in xml_cell('bad\x0bchar', '2')
+    # Tab, newline and carriage return are legal XML and pass through
+    assert 'a\tb\nc\rd' in xml_cell('a\tb\nc\rd', '2')
+
+
+def test_direct_workbook_with_control_characters_is_well_formed():
+    df = pd.DataFrame({'Supplier Name': ['bad\x0bchar', 'ok'], 'Ctrl\x01': [1, 2]})
+    output = io.BytesIO()
+    write_result_xlsx_direct(df, output)
+
+    with zipfile.ZipFile(output) as zf:
+        root = ElementTree.fromstring(zf.read('xl/worksheets/sheet1.xml'))
+
+    texts = [t.text for t in root.iterfind('.//s:t', SHEET_NS)]
+    assert texts == ['Supplier Name', 'Ctrl_x0001_', 'bad_x000B_char', 'ok']
+
+
+def test_direct_workbook_writes_booleans_as_booleans():
+    assert xml_cell(True, '2') == '<c t="b"><v>1</v></c>'
+    assert xml_cell(False, '2') == '<c t="b"><v>0</v></c>'
+
+    df = pd.DataFrame({'Flag': [True, False]})
+    output = io.BytesIO()
+    write_result_xlsx_direct(df, output)
+    output.seek(0)
+    assert pd.read_excel(output, engine='openpyxl')['Flag'].tolist() == [True, False]
@@ -0,0 +1,13 @@
+"""WSGI entry point for running outside Vercel, e.g.
+
+    gunicorn -k gthread -w 4 --threads 4 wsgi:app
+
+Requests share no state beyond best-effort caches, so scale workers with the
+CPU count; threads overlap the I/O of uploads and streamed results.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+
+from app import app  # noqa: E402,F401